@@ -2,21 +2,236 @@
 Enhanced Star Schema ETL Pipeline with Dashboard KPIs
 Optimized for dashboard performance with pre-aggregated metrics
 """
+import ast
 import duckdb
+import itertools
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
-from datetime import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Supabase caps responses at 1000 rows by default, so pages never exceed it
+PAGE_SIZE = 1000
+FETCH_WORKERS = 8
+
+# Offset pages are only stable under a total order, so every source is sorted on a unique key
+SOURCE_ORDER = {
+    'analytics_events': 'timestamp.asc,event_id.asc',
+    'daily_tool_usage': 'date.asc,tool_name.asc',
+    'session_analysis': 'session_id.asc',
+}
+
+# Fact batches above this size are loaded through a Parquet file
+PARQUET_LOAD_THRESHOLD = 100_000
+
+# Source column used to extract only events newer than the last load
+EVENTS_WATERMARK_COLUMN = 'timestamp'
+
+# Incremental extracts reach back this far before the watermark to pick up late-arriving events;
+# rows already loaded are skipped by the event_id anti-join
+EVENTS_WATERMARK_LOOKBACK = pd.Timedelta(hours=1)
+
+# DuckDB resources for the load and dashboard aggregations
+DUCKDB_THREADS = os.cpu_count() or 1
+DUCKDB_MEMORY_LIMIT = '4GB'
+
+EVENT_TYPE_KEYS = {
+    'page_view': 'evt_page_view',
+    'file_upload_started': 'evt_file_upload',
+    'processing_started': 'evt_processing',
+    'file_downloaded': 'evt_download',
+    'session_end': 'evt_session_end',
+    'error_occurred': 'evt_error'
+}
+
+# Enhanced tool metadata for dashboard
+TOOL_METADATA = pd.DataFrame.from_dict({
+    'merge': {'icon': 'merge', 'sort': 1, 'desc': 'Combine multiple PDF files into one'},
+    'nup': {'icon': 'grid', 'sort': 2, 'desc': 'Multiple pages per sheet layout'},
+    'compressor': {'icon': 'compress', 'sort': 3, 'desc': 'Reduce PDF file size'},
+    'split': {'icon': 'split', 'sort': 4, 'desc': 'Split PDF into separate pages'},
+    'homepage': {'icon': 'home', 'sort': 99, 'desc': 'Main website landing page'},
+    'pdf_bw': {'icon': 'palette', 'sort': 5, 'desc': 'Convert PDF to black and white'},
+    'page_remover': {'icon': 'delete', 'sort': 6, 'desc': 'Remove specific pages from PDF'}
+}, orient='index').rename_axis('tool_name').reset_index()
+
+# Arrow schemas matching the DuckDB tables the builders load into (created_at is left to its DEFAULT)
+FACT_ANALYTICS_SCHEMA = pa.schema([
+    ('analytics_key', pa.int64()),
+    ('tool_key', pa.int32()),
+    ('time_key', pa.int32()),
+    ('session_key', pa.string()),
+    ('event_type_key', pa.string()),
+    ('event_count', pa.int32()),
+    ('upload_flag', pa.bool_()),
+    ('download_flag', pa.bool_()),
+    ('processing_flag', pa.bool_()),
+    ('error_flag', pa.bool_()),
+    ('file_size_bytes', pa.int64()),
+    ('processing_time_ms', pa.int64()),
+    ('event_id', pa.string()),
+    ('user_id', pa.string()),
+    ('url', pa.string())
+])
+
+DIM_TOOLS_SCHEMA = pa.schema([
+    ('tool_key', pa.int32()),
+    ('tool_name', pa.string()),
+    ('tool_category', pa.string()),
+    ('tool_display_name', pa.string()),
+    ('tool_description', pa.string()),
+    ('is_active', pa.bool_()),
+    ('icon_name', pa.string()),
+    ('sort_order', pa.int32())
+])
+
+DIM_EVENT_TYPES_SCHEMA = pa.schema([
+    ('event_type_key', pa.string()),
+    ('event_type', pa.string()),
+    ('event_category', pa.string()),
+    ('event_description', pa.string()),
+    ('is_conversion_event', pa.bool_()),
+    ('event_weight', pa.float32()),
+    ('display_name', pa.string()),
+    ('icon_class', pa.string()),
+    ('color_code', pa.string())
+])
+
+# Static event types with dashboard display attributes
+EVENT_TYPES_TABLE = pa.Table.from_pylist([
+    {
+        'event_type_key': 'evt_page_view',
+        'event_type': 'page_view',
+        'event_category': 'Navigation',
+        'event_description': 'User viewed a page',
+        'is_conversion_event': False,
+        'event_weight': 1.0,
+        'display_name': 'Page Views',
+        'icon_class': 'eye',
+        'color_code': '#3B82F6'
+    },
+    {
+        'event_type_key': 'evt_file_upload',
+        'event_type': 'file_upload_started',
+        'event_category': 'Engagement',
+        'event_description': 'User uploaded a file',
+        'is_conversion_event': True,
+        'event_weight': 3.0,
+        'display_name': 'File Uploads',
+        'icon_class': 'upload',
+        'color_code': '#10B981'
+    },
+    {
+        'event_type_key': 'evt_processing',
+        'event_type': 'processing_started',
+        'event_category': 'Action',
+        'event_description': 'File processing started',
+        'is_conversion_event': True,
+        'event_weight': 2.0,
+        'display_name': 'Processing',
+        'icon_class': 'cog',
+        'color_code': '#F59E0B'
+    },
+    {
+        'event_type_key': 'evt_download',
+        'event_type': 'file_downloaded',
+        'event_category': 'Conversion',
+        'event_description': 'User downloaded processed file',
+        'is_conversion_event': True,
+        'event_weight': 5.0,
+        'display_name': 'Downloads',
+        'icon_class': 'download',
+        'color_code': '#EF4444'
+    },
+    {
+        'event_type_key': 'evt_session_end',
+        'event_type': 'session_end',
+        'event_category': 'Session',
+        'event_description': 'User session ended',
+        'is_conversion_event': False,
+        'event_weight': 0.5,
+        'display_name': 'Session Ends',
+        'icon_class': 'logout',
+        'color_code': '#6B7280'
+    },
+    {
+        'event_type_key': 'evt_error',
+        'event_type': 'error_occurred',
+        'event_category': 'Error',
+        'event_description': 'An error occurred',
+        'is_conversion_event': False,
+        'event_weight': -1.0,
+        'display_name': 'Errors',
+        'icon_class': 'exclamation',
+        'color_code': '#DC2626'
+    }
+], schema=DIM_EVENT_TYPES_SCHEMA)
+
+def _parse_props(value):
+    """Parse an event properties value (JSON or Python-repr dict) into a dict"""
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str):
+        return {}
+    try:
+        props = orjson.loads(value)
+    except orjson.JSONDecodeError:
+        try:
+            props = ast.literal_eval(value)
+        except Exception:
+            # Malformed input can also raise TypeError, MemoryError or RecursionError
+            return {}
+    return props if isinstance(props, dict) else {}
+
+def _props_json(value):
+    """Normalize an event properties value to a JSON object string (registered as a DuckDB function)"""
+    return orjson.dumps(_parse_props(value)).decode()
+
+def _page_length(response):
+    """Count the rows in a PostgREST page from its Content-Range header (e.g. '0-999/*')"""
+    rows = response.headers.get('Content-Range', '').partition('/')[0]
+    if '-' in rows:
+        start, _, end = rows.partition('-')
+        return int(end) - int(start) + 1
+    if rows == '*':
+        return 0
+    return len(orjson.loads(response.content))
+
+def _to_arrow(columns, schema):
+    """Assemble builder columns into an Arrow table cast to the target schema"""
+    return pa.Table.from_pydict(columns).cast(schema)
+
+def _time_keys(dates, hours):
+    """Encode date and hour columns as YYYYMMDDHH integer time keys"""
+    dt = pd.to_datetime(dates, errors='coerce')
+    return (dt.dt.year * 1000000 + dt.dt.month * 10000 + dt.dt.day * 100 + hours).astype('Int64')
+
 class DashboardStarSchemaETL:
-    def __init__(self):
+    def __init__(self, full_rebuild=False, profile=False):
+        self.full_rebuild = full_rebuild
+        self.profile = profile
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
-        self.duckdb_conn = duckdb.connect('data/dashboard_analytics.duckdb')
+        self.session = requests.Session()
+        self.session.headers.update({
+            'apikey': self.supabase_key,
+            'Authorization': f'Bearer {self.supabase_key}',
+        })
         os.makedirs('data', exist_ok=True)
+        self.duckdb_conn = duckdb.connect('data/dashboard_analytics.duckdb')
+        self.duckdb_conn.execute(f"PRAGMA threads={DUCKDB_THREADS}")
+        self.duckdb_conn.execute(f"PRAGMA memory_limit='{DUCKDB_MEMORY_LIMIT}'")
+        self.duckdb_conn.execute("PRAGMA enable_object_cache")
+        self.duckdb_conn.create_function('props_json', _props_json, [duckdb.typing.VARCHAR], duckdb.typing.VARCHAR)
         self.setup_dashboard_schema()
     
     def setup_dashboard_schema(self):
@@ -24,17 +239,18 @@ class DashboardStarSchemaETL:
         
         print("🎛️ Creating Dashboard-Optimized Star Schema...")
         
-        # Drop existing tables
-        tables = ['fact_analytics', 'fact_daily_kpis', 'dim_tools', 'dim_time', 'dim_sessions', 'dim_event_types']
-        for table in tables:
-            self.duckdb_conn.execute(f"DROP TABLE IF EXISTS {table}")
+        # Tables persist between runs; a full rebuild drops them and reloads everything
+        if self.full_rebuild:
+            tables = ['fact_analytics', 'fact_daily_kpis', 'dim_tools', 'dim_time', 'dim_sessions', 'dim_event_types', 'meta_watermarks']
+            for table in tables:
+                self.duckdb_conn.execute(f"DROP TABLE IF EXISTS {table}")
         
         # CENTRAL FACT TABLE (Event-level detail)
         self.duckdb_conn.execute("""
-            CREATE TABLE fact_analytics (
+            CREATE TABLE IF NOT EXISTS fact_analytics (
                 analytics_key BIGINT PRIMARY KEY,
-                tool_key VARCHAR,
-                time_key VARCHAR,
+                tool_key INTEGER,
+                time_key INTEGER,
                 session_key VARCHAR,
                 event_type_key VARCHAR,
                 event_count INTEGER DEFAULT 1,
@@ -53,10 +269,10 @@ class DashboardStarSchemaETL:
         
         # DASHBOARD KPI FACT TABLE (Pre-aggregated for performance)
         self.duckdb_conn.execute("""
-            CREATE TABLE fact_daily_kpis (
+            CREATE TABLE IF NOT EXISTS fact_daily_kpis (
                 kpi_key VARCHAR PRIMARY KEY,
                 date DATE,
-                tool_key VARCHAR,
+                tool_key INTEGER,
                 -- Core KPIs for Dashboard
                 total_events INTEGER DEFAULT 0,
                 total_uploads INTEGER DEFAULT 0,
@@ -80,8 +296,8 @@ class DashboardStarSchemaETL:
         
         # Dimensions (same as before but optimized)
         self.duckdb_conn.execute("""
-            CREATE TABLE dim_tools (
-                tool_key VARCHAR PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS dim_tools (
+                tool_key INTEGER PRIMARY KEY,
                 tool_name VARCHAR,
                 tool_category VARCHAR,
                 tool_display_name VARCHAR,
@@ -95,8 +311,8 @@ class DashboardStarSchemaETL:
         """)
         
         self.duckdb_conn.execute("""
-            CREATE TABLE dim_time (
-                time_key VARCHAR PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS dim_time (
+                time_key INTEGER PRIMARY KEY,  -- YYYYMMDDHH
                 date DATE,
                 year INTEGER,
                 month INTEGER,
@@ -116,7 +332,7 @@ class DashboardStarSchemaETL:
         """)
         
         self.duckdb_conn.execute("""
-            CREATE TABLE dim_sessions (
+            CREATE TABLE IF NOT EXISTS dim_sessions (
                 session_key VARCHAR PRIMARY KEY,
                 session_id VARCHAR,
                 user_agent VARCHAR,
@@ -131,7 +347,7 @@ class DashboardStarSchemaETL:
         """)
         
         self.duckdb_conn.execute("""
-            CREATE TABLE dim_event_types (
+            CREATE TABLE IF NOT EXISTS dim_event_types (
                 event_type_key VARCHAR PRIMARY KEY,
                 event_type VARCHAR,
                 event_category VARCHAR,
@@ -146,436 +362,510 @@ class DashboardStarSchemaETL:
             )
         """)
         
+        # Extraction watermarks for incremental loads
+        self.duckdb_conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta_watermarks (
+                source_table VARCHAR PRIMARY KEY,
+                watermark VARCHAR,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
         print("✅ Dashboard Star Schema created: 2 Facts + 4 Dimensions")
     
+    def get_watermark(self, source_table):
+        """Return the last loaded watermark for a source table, if any"""
+        
+        row = self.duckdb_conn.execute(
+            "SELECT watermark FROM meta_watermarks WHERE source_table = ?", [source_table]
+        ).fetchone()
+        return row[0] if row else None
+    
+    def save_watermark(self, source_table, watermark):
+        """Record the newest value loaded from a source table"""
+        
+        self.duckdb_conn.execute("""
+            INSERT INTO meta_watermarks (source_table, watermark) VALUES (?, ?)
+            ON CONFLICT (source_table) DO UPDATE SET
+                watermark = excluded.watermark,
+                updated_at = excluded.updated_at
+        """, [source_table, str(watermark)])
+    
     def extract_source_data(self):
         """Extract from all source tables"""
         
         tables = ['analytics_events', 'daily_tool_usage', 'session_analysis']
         data = {}
         
-        headers = {
-            'apikey': self.supabase_key,
-            'Authorization': f'Bearer {self.supabase_key}',
-        }
-        
-        for table in tables:
-            url = f"{self.supabase_url}/rest/v1/{table}"
-            try:
-                response = requests.get(url, headers=headers, params={'limit': 2000})
-                if response.status_code == 200:
-                    df = pd.DataFrame(response.json())
-                    data[table] = df
-                    print(f"📥 Extracted {len(df)} records from {table}")
-                else:
-                    print(f"❌ Error extracting {table}: {response.status_code}")
-                    data[table] = pd.DataFrame()
-            except Exception as e:
-                print(f"❌ Exception extracting {table}: {e}")
-                data[table] = pd.DataFrame()
+        # Only events from around the last load onwards are extracted; daily snapshots are refreshed in full
+        params = {table: {'order': SOURCE_ORDER[table]} for table in tables}
+        watermark = self.get_watermark('analytics_events')
+        if watermark:
+            since = (pd.Timestamp(watermark) - EVENTS_WATERMARK_LOOKBACK).isoformat()
+            params['analytics_events'][EVENTS_WATERMARK_COLUMN] = f"gte.{since}"
+            print(f"⏱️ Extracting events since {since}")
+        
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pages_pool, \
+                ThreadPoolExecutor(max_workers=len(tables)) as tables_pool:
+            futures = {
+                table: tables_pool.submit(self._fetch_table, table, pages_pool, params[table])
+                for table in tables
+            }
+            
+            for table, future in futures.items():
+                try:
+                    pages = future.result()
+                    if table == 'analytics_events':
+                        tbl = self.stage_raw_events(pages)
+                    else:
+                        tbl = pa.Table.from_pylist(list(itertools.chain.from_iterable(orjson.loads(body) for _, body in pages)))
+                    data[table] = tbl
+                    print(f"📥 Extracted {tbl.num_rows} records from {table}")
+                except requests.HTTPError as e:
+                    print(f"❌ Error extracting {table}: {e.response.status_code}")
+                    data[table] = None
+                except Exception as e:
+                    print(f"❌ Exception extracting {table}: {e}")
+                    data[table] = None
         
         return data
     
-    def build_enhanced_tools_dimension(self, events_df):
-        """Build tools dimension with dashboard attributes"""
+    def _fetch_table(self, table, pages_pool, params):
+        """Fetch every non-empty page of a source table, FETCH_WORKERS ranges at a time"""
         
-        if events_df.empty:
-            return pd.DataFrame()
+        pages = {}
+        pending = []
+        offset = 0
+        exhausted = False
+        while True:
+            # Top up with full-size ranges until one past the end of the table has come back empty
+            while not exhausted and len(pending) < FETCH_WORKERS:
+                pending.append((offset, offset + PAGE_SIZE - 1))
+                offset += PAGE_SIZE
+            if not pending:
+                break
+            
+            batch, pending = pending, []
+            results = pages_pool.map(lambda bounds: self._fetch_page(table, *bounds, params), batch)
+            for (start, end), (rows, body) in zip(batch, results):
+                if not rows:
+                    exhausted = True
+                    continue
+                pages[start] = (rows, body)
+                # A short page is either the end of the table or a server max-rows cap below PAGE_SIZE;
+                # the rest of the range is requested again and comes back empty in the first case
+                if start + rows <= end:
+                    pending.append((start + rows, end))
         
-        print("🔧 Building enhanced tools dimension...")
+        return [pages[start] for start in sorted(pages)]
+    
+    def _fetch_page(self, table, start, end, params):
+        """Fetch rows start..end of a source table as (row count, raw JSON body) using a PostgREST Range header"""
         
-        tools_data = events_df[['tool_name', 'tool_category']].drop_duplicates()
-        
-        # Enhanced tool metadata for dashboard
-        tool_metadata = {
-            'merge': {'icon': 'merge', 'sort': 1, 'desc': 'Combine multiple PDF files into one'},
-            'nup': {'icon': 'grid', 'sort': 2, 'desc': 'Multiple pages per sheet layout'},
-            'compressor': {'icon': 'compress', 'sort': 3, 'desc': 'Reduce PDF file size'},
-            'split': {'icon': 'split', 'sort': 4, 'desc': 'Split PDF into separate pages'},
-            'homepage': {'icon': 'home', 'sort': 99, 'desc': 'Main website landing page'},
-            'pdf_bw': {'icon': 'palette', 'sort': 5, 'desc': 'Convert PDF to black and white'},
-            'page_remover': {'icon': 'delete', 'sort': 6, 'desc': 'Remove specific pages from PDF'}
-        }
-        
-        tools_records = []
-        for _, row in tools_data.iterrows():
-            if pd.notna(row['tool_name']):
-                tool_key = f"tool_{row['tool_name']}"
-                metadata = tool_metadata.get(row['tool_name'], {'icon': 'tool', 'sort': 50, 'desc': f"{row['tool_name']} tool"})
-                
-                tools_records.append({
-                    'tool_key': tool_key,
-                    'tool_name': row['tool_name'],
-                    'tool_category': row['tool_category'],
-                    'tool_display_name': row['tool_name'].replace('_', ' ').title(),
-                    'tool_description': metadata['desc'],
-                    'is_active': True,
-                    'icon_name': metadata['icon'],
-                    'sort_order': metadata['sort'],
-                    'created_at': datetime.now()
-                })
-        
-        tools_df = pd.DataFrame(tools_records)
-        print(f"✅ Built {len(tools_df)} enhanced tools")
-        return tools_df
+        response = self.session.get(
+            f"{self.supabase_url}/rest/v1/{table}",
+            params=params,
+            headers={'Range-Unit': 'items', 'Range': f"{start}-{end}"}
+        )
+        # Offsets past the last row are reported as an unsatisfiable range
+        if response.status_code == 416:
+            return 0, b'[]'
+        response.raise_for_status()
+        return _page_length(response), response.content
     
-    def build_enhanced_time_dimension(self, events_df):
-        """Build time dimension with dashboard labels"""
+    def stage_raw_events(self, pages):
+        """Land raw event pages in a DuckDB temp table through its JSON reader"""
         
-        if events_df.empty:
-            return pd.DataFrame()
+        if not pages:
+            return pa.table({})
         
-        print("🕒 Building enhanced time dimension...")
+        # DuckDB parses the spooled pages straight into columnar raw_events
+        with tempfile.TemporaryDirectory() as spool_dir:
+            paths = []
+            for i, (_, body) in enumerate(pages):
+                path = os.path.join(spool_dir, f"analytics_events_{i:05d}.json")
+                with open(path, 'wb') as f:
+                    f.write(body)
+                paths.append(path)
+            
+            files = ', '.join(f"'{path}'" for path in paths)
+            self.duckdb_conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE raw_events AS
+                SELECT * FROM read_json_auto([{files}], format = 'array')
+            """)
         
-        time_data = events_df[['date', 'hour']].drop_duplicates()
+        # A jsonb properties column comes back as objects and is inferred as a STRUCT; keep it as JSON text
+        props_type = self.duckdb_conn.execute("""
+            SELECT data_type FROM duckdb_columns()
+            WHERE table_name = 'raw_events' AND column_name = 'properties'
+        """).fetchone()
+        if props_type and props_type[0] != 'VARCHAR':
+            self.duckdb_conn.execute(
+                "ALTER TABLE raw_events ALTER properties TYPE VARCHAR USING CAST(to_json(properties) AS VARCHAR)"
+            )
         
-        time_records = []
-        for _, row in time_data.iterrows():
-            if pd.notna(row['date']):
-                date_obj = pd.to_datetime(row['date'])
-                time_key = f"{row['date']}_{row['hour']:02d}"
-                
-                # Dashboard-friendly labels
-                date_label = date_obj.strftime('%b %d, %Y')
-                week_start = date_obj - pd.Timedelta(days=date_obj.weekday())
-                month_start = date_obj.replace(day=1)
-                
-                time_records.append({
-                    'time_key': time_key,
-                    'date': row['date'],
-                    'year': date_obj.year,
-                    'month': date_obj.month,
-                    'day': date_obj.day,
-                    'hour': row['hour'],
-                    'day_of_week': date_obj.weekday(),
-                    'day_name': date_obj.strftime('%A'),
-                    'month_name': date_obj.strftime('%B'),
-                    'quarter': (date_obj.month - 1) // 3 + 1,
-                    'is_weekend': date_obj.weekday() >= 5,
-                    'date_label': date_label,
-                    'week_start': week_start.date(),
-                    'month_start': month_start.date(),
-                    'created_at': datetime.now()
-                })
-        
-        time_df = pd.DataFrame(time_records)
-        print(f"✅ Built {len(time_df)} enhanced time records")
-        return time_df
+        return self.duckdb_conn.execute("SELECT * FROM raw_events").arrow()
     
-    def build_enhanced_event_types_dimension(self):
-        """Build event types with dashboard display attributes"""
-        
-        print("📋 Building enhanced event types dimension...")
-        
-        event_types = [
-            {
-                'event_type_key': 'evt_page_view',
-                'event_type': 'page_view',
-                'event_category': 'Navigation',
-                'event_description': 'User viewed a page',
-                'is_conversion_event': False,
-                'event_weight': 1.0,
-                'display_name': 'Page Views',
-                'icon_class': 'eye',
-                'color_code': '#3B82F6'
-            },
-            {
-                'event_type_key': 'evt_file_upload',
-                'event_type': 'file_upload_started',
-                'event_category': 'Engagement',
-                'event_description': 'User uploaded a file',
-                'is_conversion_event': True,
-                'event_weight': 3.0,
-                'display_name': 'File Uploads',
-                'icon_class': 'upload',
-                'color_code': '#10B981'
-            },
-            {
-                'event_type_key': 'evt_processing',
-                'event_type': 'processing_started',
-                'event_category': 'Action',
-                'event_description': 'File processing started',
-                'is_conversion_event': True,
-                'event_weight': 2.0,
-                'display_name': 'Processing',
-                'icon_class': 'cog',
-                'color_code': '#F59E0B'
-            },
-            {
-                'event_type_key': 'evt_download',
-                'event_type': 'file_downloaded',
-                'event_category': 'Conversion',
-                'event_description': 'User downloaded processed file',
-                'is_conversion_event': True,
-                'event_weight': 5.0,
-                'display_name': 'Downloads',
-                'icon_class': 'download',
-                'color_code': '#EF4444'
-            },
-            {
-                'event_type_key': 'evt_session_end',
-                'event_type': 'session_end',
-                'event_category': 'Session',
-                'event_description': 'User session ended',
-                'is_conversion_event': False,
-                'event_weight': 0.5,
-                'display_name': 'Session Ends',
-                'icon_class': 'logout',
-                'color_code': '#6B7280'
-            },
-            {
-                'event_type_key': 'evt_error',
-                'event_type': 'error_occurred',
-                'event_category': 'Error',
-                'event_description': 'An error occurred',
-                'is_conversion_event': False,
-                'event_weight': -1.0,
-                'display_name': 'Errors',
-                'icon_class': 'exclamation',
-                'color_code': '#DC2626'
-            }
-        ]
+    def assign_tool_keys(self, events_df, daily_tbl):
+        """Assign integer surrogate keys to every tool seen in the source data"""
         
-        for event_type in event_types:
-            event_type['created_at'] = datetime.now()
+        # Keys already in dim_tools are kept stable; new tools are numbered after them
+        tool_keys = dict(self.duckdb_conn.execute("SELECT tool_name, tool_key FROM dim_tools").fetchall())
+        next_key = max(tool_keys.values(), default=0) + 1
         
-        event_types_df = pd.DataFrame(event_types)
-        print(f"✅ Built {len(event_types_df)} enhanced event types")
-        return event_types_df
+        frames = [events_df['tool_name']] if 'tool_name' in events_df else []
+        if 'tool_name' in daily_tbl.column_names:
+            frames.append(daily_tbl.column('tool_name').to_pandas())
+        tool_names = pd.concat(frames).dropna().unique() if frames else []
+        for name in sorted(set(tool_names) - set(tool_keys)):
+            tool_keys[name] = next_key
+            next_key += 1
+        return tool_keys
     
-    def build_sessions_dimension(self, events_df):
-        """Build sessions dimension (same as before)"""
+    def build_enhanced_tools_dimension(self, events_df, daily_tbl):
+        """Build tools dimension with dashboard attributes"""
         
-        if events_df.empty:
-            return pd.DataFrame()
-        
-        print("👥 Building sessions dimension...")
-        
-        sessions_data = events_df.groupby('session_id').agg({
-            'timestamp': 'min',
-            'properties': 'first'
-        }).reset_index()
-        
-        sessions_records = []
-        for _, row in sessions_data.iterrows():
-            try:
-                props = {}
-                if isinstance(row['properties'], str):
-                    import json
-                    props = json.loads(row['properties'].replace("'", '"'))
-                
-                user_agent = props.get('user_agent', '')
-                
-                # Simple parsing
-                browser = 'Unknown'
-                if 'Chrome' in user_agent and 'Safari' in user_agent:
-                    browser = 'Chrome'
-                elif 'Safari' in user_agent and 'Chrome' not in user_agent:
-                    browser = 'Safari'
-                elif 'Firefox' in user_agent:
-                    browser = 'Firefox'
-                
-                os = 'Unknown'
-                if 'Windows' in user_agent:
-                    os = 'Windows'
-                elif 'Mac' in user_agent:
-                    os = 'macOS'
-                elif 'iPhone' in user_agent:
-                    os = 'iOS'
-                elif 'Android' in user_agent:
-                    os = 'Android'
-                
-                device_type = 'Mobile' if any(x in user_agent for x in ['iPhone', 'Android', 'Mobile']) else 'Desktop'
-                session_key = f"session_{row['session_id']}"
-                
-                sessions_records.append({
-                    'session_key': session_key,
-                    'session_id': row['session_id'],
-                    'user_agent': user_agent,
-                    'browser': browser,
-                    'operating_system': os,
-                    'device_type': device_type,
-                    'language': props.get('language', ''),
-                    'referrer': props.get('referrer', ''),
-                    'session_start': row['timestamp'],
-                    'created_at': datetime.now()
-                })
-                
-            except Exception as e:
-                session_key = f"session_{row['session_id']}"
-                sessions_records.append({
-                    'session_key': session_key,
-                    'session_id': row['session_id'],
-                    'user_agent': '',
-                    'browser': 'Unknown',
-                    'operating_system': 'Unknown', 
-                    'device_type': 'Unknown',
-                    'language': '',
-                    'referrer': '',
-                    'session_start': row['timestamp'],
-                    'created_at': datetime.now()
-                })
-        
-        sessions_df = pd.DataFrame(sessions_records)
-        print(f"✅ Built {len(sessions_df)} sessions")
-        return sessions_df
+        # Every keyed tool needs a row, including tools only seen in the daily usage snapshot
+        frames = [events_df[['tool_name', 'tool_category']]] if not events_df.empty else []
+        if 'tool_name' in daily_tbl.column_names:
+            daily_columns = [c for c in ('tool_name', 'tool_category') if c in daily_tbl.column_names]
+            frames.append(daily_tbl.select(daily_columns).to_pandas())
+        if not frames:
+            return DIM_TOOLS_SCHEMA.empty_table()
+        
+        print("🔧 Building enhanced tools dimension...")
+        
+        # One row per tool (tool_key is keyed on the name); keep its first non-null category, events first
+        tools_data = pd.concat(frames).groupby('tool_name', sort=False)['tool_category'].first().reset_index()
+        tools_df = tools_data.merge(TOOL_METADATA, on='tool_name', how='left')
+        tools_df = tools_df.fillna({'icon': 'tool', 'sort': 50})
+        tools_df['desc'] = tools_df['desc'].fillna(tools_df['tool_name'] + ' tool')
+        
+        tools_tbl = _to_arrow({
+            'tool_key': tools_df['tool_name'].map(self.tool_keys),
+            'tool_name': tools_df['tool_name'],
+            'tool_category': tools_df['tool_category'],
+            'tool_display_name': tools_df['tool_name'].str.replace('_', ' ').str.title(),
+            'tool_description': tools_df['desc'],
+            'is_active': np.ones(len(tools_df), dtype=bool),
+            'icon_name': tools_df['icon'],
+            'sort_order': tools_df['sort']
+        }, DIM_TOOLS_SCHEMA)
+        
+        print(f"✅ Built {tools_tbl.num_rows} enhanced tools")
+        return tools_tbl
+    
+    def load_time_dimension(self):
+        """Generate the calendar time dimension in DuckDB over the staged event dates"""
+        
+        # Every hour of every day between the first and last staged event
+        return self.duckdb_conn.execute("""
+            INSERT INTO dim_time (
+                time_key, date, year, month, day, hour,
+                day_of_week, day_name, month_name, quarter, is_weekend,
+                date_label, week_start, month_start
+            )
+            WITH days AS (
+                SELECT CAST(unnest(generate_series(
+                    CAST(MIN(date) AS DATE), CAST(MAX(date) AS DATE), INTERVAL 1 DAY
+                )) AS DATE) AS d
+                FROM raw_events
+            )
+            SELECT
+                CAST(strftime(d, '%Y%m%d') AS INTEGER) * 100 + h,
+                d,
+                year(d),
+                month(d),
+                day(d),
+                h,
+                isodow(d) - 1,  -- Monday = 0
+                dayname(d),
+                monthname(d),
+                quarter(d),
+                isodow(d) >= 6,
+                strftime(d, '%b %d, %Y'),
+                CAST(date_trunc('week', d) AS DATE),
+                CAST(date_trunc('month', d) AS DATE)
+            FROM days, range(24) AS hours(h)
+            ON CONFLICT DO NOTHING
+        """).fetchone()[0]
+    
+    def build_enhanced_event_types_dimension(self):
+        """Return the static event types dimension (built once at import)"""
+        
+        return EVENT_TYPES_TABLE
+    
+    def load_sessions_dimension(self):
+        """Build the sessions dimension in DuckDB from each session's earliest staged event"""
+        
+        # JSON properties are read natively; Python-repr dicts fall back to the props_json UDF
+        return self.duckdb_conn.execute("""
+            INSERT INTO dim_sessions (
+                session_key, session_id, user_agent, browser, operating_system,
+                device_type, language, referrer, session_start
+            )
+            WITH sessions AS (
+                SELECT
+                    session_id,
+                    MIN(CAST("timestamp" AS TIMESTAMP)) AS session_start,
+                    arg_min(CAST(properties AS VARCHAR), CAST("timestamp" AS TIMESTAMP))
+                        FILTER (WHERE properties IS NOT NULL) AS props
+                FROM raw_events
+                WHERE session_id IS NOT NULL
+                GROUP BY session_id
+            ),
+            parsed AS (
+                SELECT
+                    session_id,
+                    session_start,
+                    CAST(CASE WHEN json_valid(props) THEN props ELSE props_json(props) END AS JSON) AS props
+                FROM sessions
+            ),
+            agents AS (
+                SELECT
+                    session_id,
+                    session_start,
+                    COALESCE(json_extract_string(props, '$.user_agent'), '') AS ua,
+                    COALESCE(json_extract_string(props, '$.language'), '') AS language,
+                    COALESCE(json_extract_string(props, '$.referrer'), '') AS referrer
+                FROM parsed
+            )
+            SELECT
+                'session_' || session_id,
+                session_id,
+                ua,
+                -- Simple parsing
+                CASE
+                    WHEN ua LIKE '%Chrome%' AND ua LIKE '%Safari%' THEN 'Chrome'
+                    WHEN ua LIKE '%Safari%' THEN 'Safari'
+                    WHEN ua LIKE '%Firefox%' THEN 'Firefox'
+                    ELSE 'Unknown'
+                END,
+                CASE
+                    WHEN ua LIKE '%Windows%' THEN 'Windows'
+                    WHEN ua LIKE '%Mac%' THEN 'macOS'
+                    WHEN ua LIKE '%iPhone%' THEN 'iOS'
+                    WHEN ua LIKE '%Android%' THEN 'Android'
+                    ELSE 'Unknown'
+                END,
+                CASE
+                    WHEN ua = '' THEN 'Unknown'
+                    WHEN ua LIKE '%iPhone%' OR ua LIKE '%Android%' OR ua LIKE '%Mobile%' THEN 'Mobile'
+                    ELSE 'Desktop'
+                END,
+                language,
+                referrer,
+                session_start
+            FROM agents
+            ON CONFLICT DO NOTHING
+        """).fetchone()[0]
     
     def build_fact_analytics(self, events_df):
         """Build detailed fact table"""
         
         if events_df.empty:
-            return pd.DataFrame()
+            return FACT_ANALYTICS_SCHEMA.empty_table()
         
         print("⭐ Building detailed fact table...")
         
-        fact_records = []
+        event_type = events_df['event_type']
+        hour = pd.to_numeric(events_df['hour'], errors='coerce').astype('Int64')
         
-        for idx, row in events_df.iterrows():
-            try:
-                tool_key = f"tool_{row['tool_name']}" if pd.notna(row['tool_name']) else None
-                time_key = f"{row['date']}_{row['hour']:02d}" if pd.notna(row['date']) and pd.notna(row['hour']) else None
-                session_key = f"session_{row['session_id']}" if pd.notna(row['session_id']) else None
-                
-                event_type_map = {
-                    'page_view': 'evt_page_view',
-                    'file_upload_started': 'evt_file_upload',
-                    'processing_started': 'evt_processing',
-                    'file_downloaded': 'evt_download',
-                    'session_end': 'evt_session_end',
-                    'error_occurred': 'evt_error'
-                }
-                event_type_key = event_type_map.get(row['event_type'], 'evt_page_view')
-                
-                # Enhanced flags
-                upload_flag = row['event_type'] == 'file_upload_started'
-                download_flag = row['event_type'] == 'file_downloaded'
-                processing_flag = row['event_type'] == 'processing_started'
-                error_flag = row['event_type'] == 'error_occurred'
-                
-                # Parse properties for file size and processing time
-                props = {}
-                try:
-                    if isinstance(row['properties'], str):
-                        import json
-                        props = json.loads(row['properties'].replace("'", '"'))
-                except:
-                    props = {}
-                
-                fact_records.append({
-                    'analytics_key': idx + 1,
-                    'tool_key': tool_key,
-                    'time_key': time_key,
-                    'session_key': session_key,
-                    'event_type_key': event_type_key,
-                    'event_count': 1,
-                    'upload_flag': upload_flag,
-                    'download_flag': download_flag,
-                    'processing_flag': processing_flag,
-                    'error_flag': error_flag,
-                    'file_size_bytes': props.get('file_size'),
-                    'processing_time_ms': props.get('processing_time_ms'),
-                    'event_id': row['event_id'],
-                    'user_id': row['user_id'],
-                    'url': row['url'],
-                    'created_at': datetime.now()
-                })
-                
-            except Exception as e:
-                print(f"Warning: Skipping row {idx} due to error: {e}")
-                continue
+        props = events_df['props']
+        
+        # Continue numbering after events loaded by earlier runs
+        first_key = self.duckdb_conn.execute("SELECT COALESCE(MAX(analytics_key), 0) + 1 FROM fact_analytics").fetchone()[0]
         
-        fact_df = pd.DataFrame(fact_records)
-        print(f"✅ Built {len(fact_df)} detailed fact records")
-        return fact_df
+        fact_tbl = _to_arrow({
+            'analytics_key': np.arange(first_key, first_key + len(events_df)),
+            'tool_key': events_df['tool_name'].map(self.tool_keys).astype('Int64'),
+            'time_key': _time_keys(events_df['date'], hour),
+            'session_key': ('session_' + events_df['session_id'].astype(str)).where(events_df['session_id'].notna()),
+            'event_type_key': event_type.map(EVENT_TYPE_KEYS).fillna('evt_page_view'),
+            'event_count': np.ones(len(events_df), dtype=np.int32),
+            # Enhanced flags
+            'upload_flag': event_type.eq('file_upload_started'),
+            'download_flag': event_type.eq('file_downloaded'),
+            'processing_flag': event_type.eq('processing_started'),
+            'error_flag': event_type.eq('error_occurred'),
+            'file_size_bytes': pd.to_numeric(props.map(lambda p: p.get('file_size'), na_action='ignore'), errors='coerce').round(),
+            'processing_time_ms': pd.to_numeric(props.map(lambda p: p.get('processing_time_ms'), na_action='ignore'), errors='coerce').round(),
+            'event_id': events_df['event_id'].values,
+            'user_id': events_df['user_id'].values,
+            'url': events_df['url'].values
+        }, FACT_ANALYTICS_SCHEMA)
+        
+        print(f"✅ Built {fact_tbl.num_rows} detailed fact records")
+        return fact_tbl
     
-    def build_daily_kpis_fact(self, daily_df):
+    def build_daily_kpis_fact(self, daily_tbl):
         """Build pre-aggregated KPIs fact table for dashboard performance"""
         
-        if daily_df.empty:
-            return pd.DataFrame()
-        
         print("📊 Building daily KPIs fact table...")
         
-        kpi_records = []
-        
-        for _, row in daily_df.iterrows():
-            try:
-                kpi_key = f"{row['date']}_{row['tool_name']}"
-                tool_key = f"tool_{row['tool_name']}"
-                
-                # Calculate conversion rates
-                uploads = row['file_uploads'] if pd.notna(row['file_uploads']) else 0
-                processing = row['processing_started'] if pd.notna(row['processing_started']) else 0
-                downloads = row['downloads'] if pd.notna(row['downloads']) else 0
-                
-                upload_to_processing_rate = (processing / uploads * 100) if uploads > 0 else 0
-                processing_to_download_rate = (downloads / processing * 100) if processing > 0 else 0
-                upload_to_download_rate = (downloads / uploads * 100) if uploads > 0 else 0
-                
-                kpi_records.append({
-                    'kpi_key': kpi_key,
-                    'date': row['date'],
-                    'tool_key': tool_key,
-                    'total_events': row['total_events'],
-                    'total_uploads': uploads,
-                    'total_processing': processing,
-                    'total_downloads': downloads,
-                    'total_errors': row['errors'] if pd.notna(row['errors']) else 0,
-                    'unique_sessions': row['unique_sessions'],
-                    'unique_users': row['unique_users'],
-                    'page_views': row['page_views'],
-                    'upload_to_processing_rate': round(upload_to_processing_rate, 2),
-                    'processing_to_download_rate': round(processing_to_download_rate, 2),
-                    'upload_to_download_rate': round(upload_to_download_rate, 2),
-                    'avg_processing_time_ms': None,  # Will be calculated from detailed events if needed
-                    'avg_file_size_bytes': None,     # Will be calculated from detailed events if needed
-                    'avg_session_duration_min': None, # Will be calculated from session data if needed
-                    'created_at': datetime.now()
-                })
-                
-            except Exception as e:
-                print(f"Warning: Skipping KPI row due to error: {e}")
-                continue
+        # Conversion rates are computed by DuckDB straight from the registered Arrow source
+        tool_keys = pa.table({
+            'tool_name': pa.array(list(self.tool_keys), pa.string()),
+            'tool_key': pa.array(list(self.tool_keys.values()), pa.int32()),
+        })
+        self.duckdb_conn.register('daily_usage', daily_tbl)
+        self.duckdb_conn.register('daily_tool_keys', tool_keys)
+        try:
+            count = self.duckdb_conn.execute("""
+                INSERT INTO fact_daily_kpis (
+                    kpi_key, date, tool_key,
+                    total_events, total_uploads, total_processing, total_downloads, total_errors,
+                    unique_sessions, unique_users, page_views,
+                    upload_to_processing_rate, processing_to_download_rate, upload_to_download_rate
+                )
+                SELECT
+                    CAST(date AS VARCHAR) || '_' || tool_name AS kpi_key,
+                    CAST(date AS DATE) AS date,
+                    tool_key,
+                    total_events,
+                    uploads,
+                    processing,
+                    downloaded,
+                    COALESCE(errors, 0),
+                    unique_sessions,
+                    unique_users,
+                    page_views,
+                    CASE WHEN uploads > 0 THEN ROUND(processing / uploads * 100, 2) ELSE 0 END,
+                    CASE WHEN processing > 0 THEN ROUND(downloaded / processing * 100, 2) ELSE 0 END,
+                    CASE WHEN uploads > 0 THEN ROUND(downloaded / uploads * 100, 2) ELSE 0 END
+                FROM (
+                    SELECT
+                        *,
+                        COALESCE(file_uploads, 0) AS uploads,
+                        COALESCE(processing_started, 0) AS processing,
+                        COALESCE(downloads, 0) AS downloaded
+                    FROM daily_usage
+                    LEFT JOIN daily_tool_keys USING (tool_name)
+                    WHERE tool_name IS NOT NULL
+                )
+                ON CONFLICT (kpi_key) DO UPDATE SET
+                    tool_key = excluded.tool_key,
+                    total_events = excluded.total_events,
+                    total_uploads = excluded.total_uploads,
+                    total_processing = excluded.total_processing,
+                    total_downloads = excluded.total_downloads,
+                    total_errors = excluded.total_errors,
+                    unique_sessions = excluded.unique_sessions,
+                    unique_users = excluded.unique_users,
+                    page_views = excluded.page_views,
+                    upload_to_processing_rate = excluded.upload_to_processing_rate,
+                    processing_to_download_rate = excluded.processing_to_download_rate,
+                    upload_to_download_rate = excluded.upload_to_download_rate
+            """).fetchone()[0]
+        finally:
+            self.duckdb_conn.unregister('daily_usage')
+            self.duckdb_conn.unregister('daily_tool_keys')
         
-        kpis_df = pd.DataFrame(kpi_records)
-        print(f"✅ Built {len(kpis_df)} daily KPI records")
-        return kpis_df
+        print(f"✅ Built {count} daily KPI records")
+        return count
     
-    def load_dashboard_schema(self, fact_df, kpis_df, tools_df, time_df, sessions_df, event_types_df):
+    def load_dashboard_schema(self, fact_tbl, daily_tbl, tools_tbl, event_types_tbl, watermark=None):
         """Load all tables into dashboard schema"""
         
         print("📊 Loading dashboard schema...")
         
+        # All tables (and the watermark) commit together or not at all
+        self.duckdb_conn.execute("BEGIN TRANSACTION")
         try:
-            # Load dimensions first
-            if not tools_df.empty:
-                self.duckdb_conn.execute("INSERT INTO dim_tools SELECT * FROM tools_df")
-                print(f"   ✅ Loaded {len(tools_df)} tools")
+            # Load dimensions first (rows already present from earlier runs are kept)
+            if tools_tbl.num_rows:
+                count = self._insert_arrow('dim_tools', tools_tbl)
+                print(f"   ✅ Loaded {count} tools")
             
-            if not time_df.empty:
-                self.duckdb_conn.execute("INSERT INTO dim_time SELECT * FROM time_df")
-                print(f"   ✅ Loaded {len(time_df)} time records")
+            if fact_tbl.num_rows:
+                count = self.load_time_dimension()
+                print(f"   ✅ Loaded {count} time records")
             
-            if not sessions_df.empty:
-                sessions_df = sessions_df.drop_duplicates(subset=['session_key'])
-                self.duckdb_conn.execute("INSERT INTO dim_sessions SELECT * FROM sessions_df")
-                print(f"   ✅ Loaded {len(sessions_df)} sessions")
+            if fact_tbl.num_rows:
+                count = self.load_sessions_dimension()
+                print(f"   ✅ Loaded {count} sessions")
             
-            if not event_types_df.empty:
-                self.duckdb_conn.execute("INSERT INTO dim_event_types SELECT * FROM event_types_df")
-                print(f"   ✅ Loaded {len(event_types_df)} event types")
+            if event_types_tbl.num_rows:
+                count = self._insert_arrow('dim_event_types', event_types_tbl)
+                print(f"   ✅ Loaded {count} event types")
             
             # Load fact tables
-            if not fact_df.empty:
-                self.duckdb_conn.execute("INSERT INTO fact_analytics SELECT * FROM fact_df")
-                print(f"   ✅ Loaded {len(fact_df)} detailed fact records")
+            if fact_tbl.num_rows > PARQUET_LOAD_THRESHOLD:
+                count = self._insert_parquet('fact_analytics', fact_tbl, natural_key='event_id')
+                print(f"   ✅ Loaded {count} detailed fact records (via Parquet)")
+            elif fact_tbl.num_rows:
+                count = self._insert_arrow('fact_analytics', fact_tbl, natural_key='event_id')
+                print(f"   ✅ Loaded {count} detailed fact records")
+            
+            if daily_tbl.num_rows:
+                count = self.build_daily_kpis_fact(daily_tbl)
+                print(f"   ✅ Loaded {count} daily KPI records")
+                
+                self.update_kpi_performance_metrics()
+                print("   ✅ Updated KPI performance metrics")
             
-            if not kpis_df.empty:
-                self.duckdb_conn.execute("INSERT INTO fact_daily_kpis SELECT * FROM kpis_df")
-                print(f"   ✅ Loaded {len(kpis_df)} daily KPI records")
+            if watermark is not None:
+                self.save_watermark('analytics_events', watermark)
+                print(f"   ✅ Events watermark advanced to {watermark}")
+            
+            self.duckdb_conn.execute("COMMIT")
                 
         except Exception as e:
+            self.duckdb_conn.execute("ROLLBACK")
             print(f"❌ Loading error: {e}")
+            # Nothing was loaded; fail the run so schedulers do not report success
+            raise
+    
+    def update_kpi_performance_metrics(self):
+        """Fill KPI performance averages from the detailed fact table"""
+        
+        self.duckdb_conn.execute("""
+            UPDATE fact_daily_kpis AS k
+            SET avg_processing_time_ms = a.avg_processing_time_ms,
+                avg_file_size_bytes = a.avg_file_size_bytes
+            FROM (
+                SELECT
+                    t.date,
+                    f.tool_key,
+                    AVG(f.processing_time_ms) AS avg_processing_time_ms,
+                    AVG(f.file_size_bytes) AS avg_file_size_bytes
+                FROM fact_analytics f
+                JOIN dim_time t ON f.time_key = t.time_key
+                GROUP BY 1, 2
+            ) AS a
+            WHERE k.date = a.date AND k.tool_key = a.tool_key
+        """)
+    
+    def _insert_arrow(self, table, arrow_tbl, natural_key=None):
+        """Insert a built Arrow table through a registered view (zero-copy scan)"""
+        
+        # Columns are matched by name; any the table omits fall back to their DEFAULT
+        view = f"{table}_arrow"
+        self.duckdb_conn.register(view, arrow_tbl)
+        try:
+            return self.duckdb_conn.execute(self._insert_sql(table, arrow_tbl, view, natural_key)).fetchone()[0]
+        finally:
+            self.duckdb_conn.unregister(view)
+    
+    def _insert_parquet(self, table, arrow_tbl, natural_key=None):
+        """Insert a large Arrow table through a temporary Parquet file (parallel columnar read)"""
+        
+        with tempfile.TemporaryDirectory() as spool_dir:
+            path = os.path.join(spool_dir, f"{table}.parquet")
+            pq.write_table(arrow_tbl, path, compression='zstd', row_group_size=100_000)
+            return self.duckdb_conn.execute(
+                self._insert_sql(table, arrow_tbl, f"read_parquet('{path}')", natural_key)
+            ).fetchone()[0]
+    
+    def _insert_sql(self, table, arrow_tbl, source, natural_key=None):
+        """INSERT ... SELECT that skips rows already loaded (by primary key, or natural_key when given)"""
+        
+        columns = ', '.join(arrow_tbl.column_names)
+        sql = f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {source} AS src"
+        # Surrogate keys are generated per load, so re-extracted rows are matched on their natural key
+        if natural_key:
+            sql += f" WHERE NOT EXISTS (SELECT 1 FROM {table} AS t WHERE t.{natural_key} = src.{natural_key})"
+        return sql + " ON CONFLICT DO NOTHING"
     
     def generate_dashboard_queries(self):
         """Generate optimized queries for dashboard KPIs"""
@@ -583,6 +873,12 @@ class DashboardStarSchemaETL:
         print("\n🎛️ DASHBOARD KPI QUERIES:")
         print("=" * 45)
         
+        # Print each query's operator tree to surface hot operators
+        if self.profile:
+            self.duckdb_conn.execute("PRAGMA enable_profiling='query_tree'")
+        
+        # Tabular results come back as Arrow and are wrapped zero-copy for printing
+        
         # Total KPIs (from pre-aggregated table)
         try:
             result = self.duckdb_conn.execute("""
@@ -625,7 +921,7 @@ class DashboardStarSchemaETL:
                 GROUP BY t.tool_display_name, t.icon_name, t.sort_order
                 ORDER BY downloads DESC
                 LIMIT 5
-            """).fetchdf()
+            """).arrow().to_pandas(split_blocks=True, self_destruct=True, types_mapper=pd.ArrowDtype)
             
             print("\n🏆 TOP PERFORMING TOOLS:")
             print(result.to_string(index=False))
@@ -642,17 +938,21 @@ class DashboardStarSchemaETL:
                     SUM(k.total_uploads) as uploads,
                     SUM(k.total_processing) as processing
                 FROM fact_daily_kpis k
-                JOIN dim_time tm ON k.date = tm.date
+                -- dim_time is hourly; one row per date keeps the daily totals from fanning out
+                JOIN dim_time tm ON k.date = tm.date AND tm.hour = 0
                 GROUP BY tm.date_label, k.date
                 ORDER BY k.date DESC
                 LIMIT 7
-            """).fetchdf()
+            """).arrow().to_pandas(split_blocks=True, self_destruct=True, types_mapper=pd.ArrowDtype)
             
             print("\n📈 RECENT DAILY TRENDS:")
             print(result.to_string(index=False))
             
         except Exception as e:
             print(f"Daily trends query error: {e}")
+        
+        if self.profile:
+            self.duckdb_conn.execute("PRAGMA disable_profiling")
     
     def run_dashboard_etl(self):
         """Run complete dashboard-optimized ETL"""
@@ -663,25 +963,50 @@ class DashboardStarSchemaETL:
         
         # Extract source data
         source_data = self.extract_source_data()
-        events_df = source_data.get('analytics_events', pd.DataFrame())
-        daily_df = source_data.get('daily_tool_usage', pd.DataFrame())
         
-        if events_df.empty or daily_df.empty:
+        # A failed extraction (None) is not the same as an empty one; never load a partial pull
+        failed = [table for table, tbl in source_data.items() if tbl is None]
+        if failed:
+            print(f"❌ Extraction failed for {', '.join(failed)}; nothing was loaded")
+            sys.exit(1)
+        
+        events_tbl = source_data['analytics_events']
+        daily_tbl = source_data['daily_tool_usage']
+        
+        if not daily_tbl.num_rows or (not events_tbl.num_rows and self.full_rebuild):
             print("❌ Missing required data")
             return
         
+        # The event builders still work on pandas; release the Arrow buffers as columns convert
+        events_df = events_tbl.to_pandas(split_blocks=True, self_destruct=True)
+        del events_tbl
+        
+        # Integer surrogate keys shared by dim_tools and both fact tables
+        self.tool_keys = self.assign_tool_keys(events_df, daily_tbl)
+        
+        watermark = None
+        if events_df.empty:
+            print("ℹ️ No new events since the last load")
+        else:
+            # The lookback window can return only events older than the saved watermark; never move it back
+            watermark = events_df[EVENTS_WATERMARK_COLUMN].max()
+            previous = self.get_watermark('analytics_events')
+            if previous and pd.Timestamp(previous) > pd.Timestamp(watermark):
+                watermark = previous
+            # An event repeated across pages is loaded once
+            events_df = events_df[~(events_df['event_id'].duplicated() & events_df['event_id'].notna())]
+            # Parse event properties once for the sessions and fact builders
+            events_df['props'] = events_df['properties'].map(_parse_props).where(events_df['properties'].notna())
+        
         # Build enhanced dimensions
-        tools_df = self.build_enhanced_tools_dimension(events_df)
-        time_df = self.build_enhanced_time_dimension(events_df)
-        sessions_df = self.build_sessions_dimension(events_df)
-        event_types_df = self.build_enhanced_event_types_dimension()
+        tools_tbl = self.build_enhanced_tools_dimension(events_df, daily_tbl)
+        event_types_tbl = self.build_enhanced_event_types_dimension()
         
         # Build fact tables
-        fact_df = self.build_fact_analytics(events_df)
-        kpis_df = self.build_daily_kpis_fact(daily_df)
+        fact_tbl = self.build_fact_analytics(events_df)
         
-        # Load dashboard schema
-        self.load_dashboard_schema(fact_df, kpis_df, tools_df, time_df, sessions_df, event_types_df)
+        # Load dashboard schema (dim_time, dim_sessions and daily KPIs are computed in DuckDB during the load)
+        self.load_dashboard_schema(fact_tbl, daily_tbl, tools_tbl, event_types_tbl, watermark)
         
         # Generate dashboard queries
         self.generate_dashboard_queries()
@@ -696,5 +1021,8 @@ class DashboardStarSchemaETL:
         print("   ✓ Query tables: fact_analytics, fact_daily_kpis, dim_tools, dim_time")
 
 if __name__ == "__main__":
-    etl = DashboardStarSchemaETL()
+    etl = DashboardStarSchemaETL(
+        full_rebuild='--full-rebuild' in sys.argv,
+        profile='--profile' in sys.argv,
+    )
     etl.run_dashboard_etl()
\ No newline at end of file